@@ -25,10 +25,10 @@ def macro_event_criteria(heart_rate):
 # Compute results using MECS
 macro_events = mecs.identify_macro_events(time_series, macro_event_criteria)
 macro_event_results = mecs.compute_macro_event_synchronization(macro_events)
-aggregated_macro_event_results = mecs.compute_aggregated_macro_event_synchronization(macro_event_results, aggregation_classes)
+aggregated_macro_event_results = mecs.compute_aggregated_macro_event_synchronization(macro_event_results, aggregation_classes, classes=classes)
 intra_class_results = mecs.compute_intra_class_synchronization(time_series, classes)
 inter_class_results = mecs.compute_inter_class_synchronization(time_series, classes)
-aggregated_inter_class_results = mecs.compute_aggregated_inter_class_synchronization(inter_class_results, aggregation_classes)
+aggregated_inter_class_results = mecs.compute_aggregated_inter_class_synchronization(inter_class_results, aggregation_classes, classes=classes)
 
 # Combine results
 results = {
@@ -52,8 +52,12 @@ categories = [
 
 for title, key in categories:
     print(f"\n{title}:")
-    for sub_key, value in final_results[key].items():
-        print(sub_key, value)
+    if isinstance(final_results[key], dict):
+        for sub_key, value in final_results[key].items():
+            print(sub_key, value)
+    else:
+        # (S, S) score matrix; NaN marks pairs that are not part of this comparison
+        print(np.round(final_results[key], 4))
 
 # Visualize results using MECSVisualizer
 visualizer = MECSVisualizer(final_results)
@@ -1,12 +1,173 @@
+import numbers
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+
 import numpy as np
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    from scipy.spatial.distance import cdist
+except ImportError:
+    cdist = None
+
+# Target size of one row-chunk of the (N, M) distance matrix, roughly an L2 cache
+_CHUNK_BYTES = 256 * 1024
+
+# Upper bound on the number of elements in one batched (J, W, W) tile on the GPU
+_GPU_BLOCK_ELEMENTS = 2 ** 26
+
+
+# Float series whose prefix sums could be off by more than this (in units of one full
+# coincidence) are summed window by window instead
+_PREFIX_SUM_TOLERANCE = 1e-6
+
+# Upper bound on the number of (a, b) pairs expanded at once by the NumPy window sum
+_WINDOW_PAIRS = 2 ** 20
+
+_EPS = np.finfo(np.float64).eps
+
+
+def _prefix_sums_cancel(m, span, tau_min):
+    """Whether float64 prefix sums of m values within span could exceed _PREFIX_SUM_TOLERANCE."""
+    # A window sum's rounding error is at most about 4 * eps * |P[-1]| <= 4 * eps * m * span
+    return 4 * _EPS * m * span > _PREFIX_SUM_TOLERANCE * tau_min
+
+
+def _window_coincidences_numpy(A, B, tau):
+    """Mean default coincidence of two sorted float series, summing each window directly."""
+    lo = np.searchsorted(B, A - tau.max(), side='left')
+    hi = np.searchsorted(B, A + tau.max(), side='right')
+    ends = np.cumsum(hi - lo)
+    cuts = np.searchsorted(ends, np.arange(_WINDOW_PAIRS, ends[-1], _WINDOW_PAIRS), side='right')
+    bounds = np.unique(np.concatenate(([0], cuts, [A.size])))
+    totals = np.zeros(len(tau))
+    for a0, a1 in zip(bounds[:-1], bounds[1:]):
+        counts = hi[a0:a1] - lo[a0:a1]
+        starts = np.cumsum(counts) - counts
+        b_idx = np.arange(counts.sum()) - np.repeat(starts - lo[a0:a1], counts)
+        d = np.abs(B[b_idx] - np.repeat(A[a0:a1], counts))
+        for k, tau_k in enumerate(tau):
+            totals[k] += np.maximum(1 - d / tau_k, 0).sum()
+    return totals / (A.size * B.size)
+
+
+def _sorted_coincidences_numpy(A, B, tau, exact):
+    """Mean default coincidence of two sorted, non-empty series for every tau, from prefix sums of B."""
+    # A common origin keeps the prefix sums small; int64 series (exact) sum without rounding
+    origin = min(A[0], B[0])
+    A = A - origin
+    B = B - origin
+    if not exact and _prefix_sums_cancel(B.size, max(A[-1], B[-1]), tau.min()):
+        return _window_coincidences_numpy(A, B, tau)
+    P = np.concatenate(([0], np.cumsum(B)))
+    t = tau[:, None]
+    mid = np.searchsorted(B, A, side='left')
+    lo = np.searchsorted(B, A - t, side='left')
+    hi = np.searchsorted(B, A + t, side='right')
+    left = A * (mid - lo) - (P[mid] - P[lo])
+    right = (P[hi] - P[mid]) - A * (hi - mid)
+    sums = (hi - lo) - (left + right) * (1.0 / t)
+    return sums.sum(axis=1) / (A.size * B.size)
+
+
+if numba is not None:
+    _prefix_sums_cancel = numba.njit(cache=True)(_prefix_sums_cancel)
+
+    # No fastmath: reassociating the prefix-sum differences would reintroduce the cancellation
+    @numba.njit(cache=True)
+    def _sorted_coincidences(A, B, tau, exact):
+        """Numba version of _sorted_coincidences_numpy, bracketing each window with three pointers."""
+        n, m, K = A.shape[0], B.shape[0], tau.shape[0]
+        origin = min(A[0], B[0])
+        out = np.zeros(K)
+        if not exact and _prefix_sums_cancel(m, max(A[n - 1], B[m - 1]) - origin, tau.min()):
+            t_max = tau.max()
+            lo = 0
+            hi = 0
+            for a in range(n):
+                x = A[a] - origin
+                while lo < m and B[lo] - origin < x - t_max:
+                    lo += 1
+                while hi < m and B[hi] - origin <= x + t_max:
+                    hi += 1
+                for b in range(lo, hi):
+                    d = abs(B[b] - origin - x)
+                    for k in range(K):
+                        if d <= tau[k]:
+                            out[k] += 1.0 - d / tau[k]
+            return out / (n * m)
+        P = np.zeros(m + 1, dtype=B.dtype)
+        for b in range(m):
+            P[b + 1] = P[b] + (B[b] - origin)
+        for k in range(K):
+            t = tau[k]
+            inv_t = 1.0 / t
+            lo = 0
+            mid = 0
+            hi = 0
+            s = 0.0
+            for a in range(n):
+                x = A[a] - origin
+                while lo < m and B[lo] - origin < x - t:
+                    lo += 1
+                while mid < m and B[mid] - origin < x:
+                    mid += 1
+                while hi < m and B[hi] - origin <= x + t:
+                    hi += 1
+                left = x * (mid - lo) - (P[mid] - P[lo])
+                right = (P[hi] - P[mid]) - x * (hi - mid)
+                s += (hi - lo) - (left + right) * inv_t
+            out[k] = s / (n * m)
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _sorted_pair_scores(flat, offsets, rows, cols, tau, exact):
+        """Tau-averaged default score of every pair (rows[p], cols[p]) of the sorted series in flat."""
+        out = np.empty(rows.shape[0])
+        for p in numba.prange(rows.shape[0]):
+            A = flat[offsets[rows[p]]:offsets[rows[p] + 1]]
+            B = flat[offsets[cols[p]]:offsets[cols[p] + 1]]
+            if A.shape[0] == 0 or B.shape[0] == 0:
+                out[p] = np.nan
+            else:
+                out[p] = _sorted_coincidences(A, B, tau, exact).mean()
+        return out
+else:
+    _sorted_coincidences = _sorted_coincidences_numpy
+
 class MECS:
     """Multi-Event-Class Synchronization (MECS) algorithm class."""
 
-    def __init__(self, tau, distance_metric=None, coincidence_function=None):
+    def __init__(self, tau, distance_metric=None, coincidence_function=None, symmetric=None, backend='cpu', n_jobs=None):
         self.tau = np.array(tau)
+        self._inv_tau_count = 1.0 / len(self.tau)
         self.distance_metric = distance_metric or self._default_distance_metric
         self.coincidence_function = coincidence_function or self._default_coincidence_function
+        # The sorted-window kernel is only valid for the default |x - y| / triangular window pair
+        self._default_functions = distance_metric is None and coincidence_function is None
+        # A symmetric distance gives score(i, j) == score(j, i); custom metrics must opt in
+        self.symmetric = distance_metric is None if symmetric is None else symmetric
+        self._use_cdist = cdist is not None and distance_metric is None
+        # int16 only bounds |x - y| itself; custom functions may grow past it (e.g. (x - y) ** 2 or d ** 2)
+        self._narrow_integers = self._default_functions
+        if backend not in ('cpu', 'cuda'):
+            raise ValueError(f"backend must be 'cpu' or 'cuda', got {backend!r}")
+        self.backend = backend
+        is_count = isinstance(n_jobs, numbers.Integral) and not isinstance(n_jobs, bool)
+        if n_jobs is not None and not (is_count and (n_jobs >= 1 or n_jobs == -1)):
+            raise ValueError(f"n_jobs must be None, -1 or a positive integer, got {n_jobs!r}")
+        # Threads for the NumPy pair loop (-1 for all cores); the Numba kernel runs its own threads
+        self.n_jobs = n_jobs
+        if backend == 'cuda':
+            # Imported lazily so that CuPy (and a CUDA runtime) is only needed for the GPU backend
+            import cupy
+            self._cp = cupy
 
     @staticmethod
     def _default_distance_metric(x, y):
@@ -14,92 +175,240 @@ class MECS:
 
     @staticmethod
     def _default_coincidence_function(d, tau_k):
-        return (1 - d / tau_k) * (0 <= d) * (d <= tau_k)
+        # One float32 (or d's float dtype) buffer: a multiply by the reciprocal, then in-place updates.
+        # d itself is left untouched because callers reuse it for every tau.
+        dtype = np.result_type(d.dtype, np.float32)
+        # The reciprocal is rounded to c's dtype, so float64 distances keep float64 precision
+        c = np.multiply(d, dtype.type(1.0 / tau_k), dtype=dtype)
+        np.subtract(1, c, out=c)
+        # c > 1 only where d < 0 and c < 0 only where d > tau_k; both lie outside the window
+        c[c > 1] = 0
+        return np.maximum(c, 0, out=c)
+
+    @staticmethod
+    def _as_series(ts, narrow=True):
+        """Convert a series to a contiguous array once, narrowing small integers to int16 if narrow."""
+        ts = np.ascontiguousarray(ts)
+        # Pairwise differences of values in [-2**14, 2**14) still fit in int16
+        if narrow and np.issubdtype(ts.dtype, np.integer) and ts.size and ts.min() >= -2**14 and ts.max() < 2**14:
+            return ts.astype(np.int16, copy=False)
+        return ts
 
-    # def _calculate_coincidences(self, TSi, TSj, tau_k):
-    #     distances = self.distance_metric(TSi[:, None], TSj)
-    #     coincidences = self.coincidence_function(distances, tau_k)
-    #     return coincidences
+    def _calculate_coincidences(self, TSi, TSj):
+        """Return the mean coincidence between two series for every tau.
 
-    def _calculate_coincidences(self, TSi, TSj, tau_k):
-        TSi = np.array(TSi)
-        TSj = np.array(TSj)
-        distances = self.distance_metric(TSi[:, None], TSj)
-        coincidences = self.coincidence_function(distances, tau_k)
-        return coincidences
+        The (N, M) distance matrix is streamed in row-chunks of about _CHUNK_BYTES, so peak
+        memory stays bounded for long series; the coincidence function must be element-wise.
+        """
+        n, m = len(TSi), len(TSj)
+        if n == 0 or m == 0:
+            return np.full(len(self.tau), np.nan)
+        totals = np.zeros(len(self.tau))
+        # Sized for float64 coincidences, the widest temporary per chunk
+        rows = max(1, _CHUNK_BYTES // (8 * m))
+        for a0 in range(0, n, rows):
+            chunk = TSi[a0:a0 + rows]
+            # The distance block does not depend on tau, so it is computed once per chunk
+            if self._use_cdist and chunk.dtype.kind == 'f':
+                # SciPy's C loop beats the float64 broadcast; int16 series are as fast (and narrower) in NumPy
+                distances = cdist(chunk.reshape(-1, 1), TSj.reshape(-1, 1), metric='cityblock')
+            else:
+                distances = self.distance_metric(chunk[:, None], TSj)
+            for k, tau_k in enumerate(self.tau):
+                # Accumulate in float64 without materializing a float64 copy of the coincidences
+                totals[k] += np.sum(self.coincidence_function(distances, tau_k), dtype=np.float64)
+        return totals / (n * m)
 
+    def _default_coincidences(self, TSi, TSj):
+        """Return the mean default coincidence of two sorted series for every tau."""
+        if len(TSi) == 0 or len(TSj) == 0:
+            return np.full(len(self.tau), np.nan)
+        return _sorted_coincidences(TSi, TSj, self.tau, TSi.dtype.kind in 'iu')
+
+    @staticmethod
+    def _sorted_series(time_series):
+        """Concatenate a sorted copy of each series into one flat buffer, returning it with their offsets.
+
+        The buffer is int64 for integer series, so the sorted kernels' prefix sums are exact,
+        and float64 otherwise.
+        """
+        time_series = [np.asarray(ts) for ts in time_series]
+        exact = all(ts.dtype.kind in 'iu' for ts in time_series if ts.size)
+        offsets = np.zeros(len(time_series) + 1, dtype=np.intp)
+        np.cumsum([ts.size for ts in time_series], out=offsets[1:])
+        flat = np.empty(offsets[-1], dtype=np.int64 if exact else np.float64)
+        for ts, o0, o1 in zip(time_series, offsets[:-1], offsets[1:]):
+            flat[o0:o1] = ts
+            flat[o0:o1].sort()
+        return flat, offsets
+
+    def _pack_series(self, time_series):
+        """Pack the series into a zero-padded (S, max_len) buffer for the GPU, returning it with their lengths."""
+        time_series = [self._as_series(ts, self._narrow_integers) for ts in time_series]
+        lengths = np.array([len(ts) for ts in time_series], dtype=np.intp)
+        dtype = reduce(np.promote_types, (ts.dtype for ts in time_series), np.dtype(np.int16))
+        packed = np.zeros((len(time_series), max(lengths, default=0)), dtype=dtype)
+        for row, ts, n in zip(packed, time_series, lengths):
+            row[:n] = ts
+        return packed, lengths
+
+    def _prepare_series(self, time_series):
+        """Cast each series once and pick the pair kernel matching the configured functions."""
+        if self._default_functions:
+            flat, offsets = self._sorted_series(time_series)
+            return [flat[o0:o1] for o0, o1 in zip(offsets[:-1], offsets[1:])], self._default_coincidences
+        return [self._as_series(ts, self._narrow_integers) for ts in time_series], self._calculate_coincidences
+
+    def _score_pairs(self, time_series, rows, cols):
+        """Return the tau-averaged score of each pair (rows[p], cols[p])."""
+        if self._default_functions and numba is not None:
+            # One parallel Numba loop over all pairs instead of a Python-level loop
+            flat, offsets = self._sorted_series(time_series)
+            return _sorted_pair_scores(flat, offsets, rows, cols, self.tau, flat.dtype.kind in 'iu')
+        series, coincidences = self._prepare_series(time_series)
+
+        def score(i, j):
+            # Averaging over tau here replaces the separate normalization pass
+            return coincidences(series[i], series[j]).sum() * self._inv_tau_count
+
+        if self.n_jobs in (None, 1) or len(rows) < 2:
+            return [score(i, j) for i, j in zip(rows, cols)]
+        # Pairs are independent and the NumPy kernels release the GIL, so threads scale
+        with ThreadPoolExecutor(max_workers=os.cpu_count() if self.n_jobs == -1 else self.n_jobs) as pool:
+            return list(pool.map(score, rows, cols))
+
+    def _score_pairs_cuda(self, time_series, rows, cols):
+        """GPU version of _score_pairs: each series is scored against its partners in one (J, W, W) tile.
+
+        Padding beyond each series' length is masked out, so ragged input (e.g. macro-events)
+        is handled exactly; the distance and coincidence functions must accept CuPy arrays.
+        """
+        cp = self._cp
+        packed, lengths = self._pack_series(time_series)
+        width = packed.shape[1]
+        TS = cp.asarray(packed)
+        valid = cp.arange(width)[None, :] < cp.asarray(lengths)[:, None]
+        block = max(1, _GPU_BLOCK_ELEMENTS // max(width * width, 1))
+        pair_scores = np.empty(len(rows))
+        for i in np.unique(rows):
+            partners = np.flatnonzero(rows == i)
+            for p0 in range(0, len(partners), block):
+                sel = partners[p0:p0 + block]
+                js = cp.asarray(cols[sel])
+                distances = self.distance_metric(TS[i][None, :, None], TS[js][:, None, :])
+                weight = valid[i][None, :, None] & valid[js][:, None, :]
+                totals = cp.zeros(len(sel))
+                for tau_k in self.tau:
+                    totals += (self.coincidence_function(distances, tau_k) * weight).sum(axis=(1, 2), dtype=cp.float64)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    # Empty series give 0 / 0 = NaN, as on the CPU
+                    pair_scores[sel] = cp.asnumpy(totals) / (lengths[i] * lengths[cols[sel]]) * self._inv_tau_count
+        return pair_scores
+
+    @staticmethod
+    def _encode_classes(classes):
+        """Return the distinct class labels and an int32 code per series indexing into them."""
+        labels, codes = np.unique(np.asarray(classes), return_inverse=True)
+        return labels, codes.astype(np.int32)
+
+    @staticmethod
+    def _class_to_agg(aggregation_classes):
+        """Map each class label to the frozenset of aggregation classes that contain it."""
+        class_to_agg = defaultdict(set)
+        for agg_class in aggregation_classes:
+            for label in agg_class:
+                class_to_agg[label].add(agg_class)
+        return {label: frozenset(agg) for label, agg in class_to_agg.items()}
 
     def compute_intra_class_synchronization(self, time_series, classes):
-        condition = lambda i, j: i != j and classes[i] == classes[j]
-        return self._compute_synchronization(time_series, classes, condition)
+        """Return an (S, S) array of synchronization scores, NaN outside same-class pairs."""
+        _, codes = self._encode_classes(classes)
+        mask = (codes[:, None] == codes[None, :]) & ~np.eye(len(codes), dtype=bool)
+        return self._compute_synchronization(time_series, mask)
 
     def compute_inter_class_synchronization(self, time_series, classes):
-        condition = lambda i, j: i != j and classes[i] != classes[j]
-        return self._compute_synchronization(time_series, classes, condition)
-
-    def _compute_synchronization(self, time_series, classes, condition):
-        results = {}
-        for k, tau_k in enumerate(self.tau):
-            for i, TSi in enumerate(time_series):
-                for j, TSj in enumerate(time_series):
-                    if condition(i, j):
-                        key = (i, j, classes[i], classes[j]) # Include classes in the key
-                        coincidences = self._calculate_coincidences(TSi, TSj, tau_k)
-                        results[key] = np.sum(coincidences) / coincidences.size
-        return results
+        """Return an (S, S) array of synchronization scores, NaN outside cross-class pairs."""
+        _, codes = self._encode_classes(classes)
+        return self._compute_synchronization(time_series, codes[:, None] != codes[None, :])
+
+    def _compute_synchronization(self, time_series, mask):
+        """Score every pair (i, j) selected by the (S, S) boolean mask; other entries are NaN."""
+        scores = np.full(mask.shape, np.nan)
+        # With a symmetric metric only the upper triangle is computed and then mirrored
+        pairs = np.triu(mask | mask.T, k=1) if self.symmetric else mask
+        rows, cols = np.nonzero(pairs)
+        if self.backend == 'cuda':
+            scores[rows, cols] = self._score_pairs_cuda(time_series, rows, cols)
+        else:
+            scores[rows, cols] = self._score_pairs(time_series, rows, cols)
+        if self.symmetric:
+            scores[cols, rows] = scores[rows, cols]
+        scores[~mask] = np.nan
+        return scores
 
-    def compute_aggregated_inter_class_synchronization(self, inter_class_results, aggregation_classes):
-        results = {}
+    def _aggregate(self, results, classes, aggregation_classes):
+        """Average the non-NaN scores of pairs whose classes both belong to each aggregation class."""
+        aggregated = {}
         if aggregation_classes:
+            labels, codes = self._encode_classes(classes)
+            class_to_agg = self._class_to_agg(aggregation_classes)
+            label_aggs = [class_to_agg.get(label, frozenset()) for label in labels]
             for agg_class in aggregation_classes:
-                aggregated_result = 0
-                count = 0
-                for key, value in inter_class_results.items():
-                    if key[2] in agg_class and key[3] in agg_class:
-                        aggregated_result += value
-                        count += 1
-                if count > 0:
-                    results[agg_class] = aggregated_result / count
-        return results
+                members = np.array([agg_class in aggs for aggs in label_aggs], dtype=bool)[codes]
+                values = results[np.ix_(members, members)]
+                values = values[~np.isnan(values)]
+                if values.size > 0:
+                    aggregated[agg_class] = values.mean()
+        return aggregated
+
+    def compute_aggregated_inter_class_synchronization(self, inter_class_results, aggregation_classes, *, classes):
+        return self._aggregate(inter_class_results, classes, aggregation_classes)
 
     def finalize_results(self, results):
-        # Normalizing Results
-        for category in results:
-            for key in results[category]:
-                results[category][key] = results[category][key] / len(self.tau)
+        # Identity: the compute methods already average each score over tau; kept for compatibility
         return results
 
-    def identify_macro_events(self, time_series, macro_event_criteria):
-        """Identify macro-events based on given criteria."""
+    def identify_macro_events(self, time_series, macro_event_criteria, vectorized=True, return_indices=False):
+        """Identify macro-events based on given criteria.
+
+        With vectorized=True the criteria is first called once per series on the whole array
+        and should return a boolean mask (e.g. ``lambda x: x > 180``). Criteria that reject an
+        array or do not return one value per element (e.g. ``lambda x: 1 < x < 3``) are
+        applied element by element instead, as with vectorized=False. With return_indices=True
+        the positions of the macro-events are returned instead of their values.
+        """
         macro_events = []
         for ts in time_series:
-            macro_event = [event for event in ts if macro_event_criteria(event)]
+            mask = None
+            if vectorized:
+                ts = np.asarray(ts)
+                try:
+                    mask = np.asarray(macro_event_criteria(ts), dtype=bool)
+                except (TypeError, ValueError):
+                    # e.g. chained comparisons, which need the truth value of the whole array
+                    pass
+                if mask is not None and mask.shape != ts.shape:
+                    # e.g. ``lambda x: x is not None``, which returns a single bool for the array
+                    mask = None
+            if mask is not None:
+                macro_event = np.flatnonzero(mask) if return_indices else ts[mask]
+            elif return_indices:
+                macro_event = [t for t, event in enumerate(ts) if macro_event_criteria(event)]
+            else:
+                macro_event = [event for event in ts if macro_event_criteria(event)]
             macro_events.append(macro_event)
         return macro_events
 
     def compute_macro_event_synchronization(self, macro_events):
-        """Compute synchronization for macro-events."""
-        results = {}
-        for k, tau_k in enumerate(self.tau):
-            for i, MEi in enumerate(macro_events):
-                for j, MEj in enumerate(macro_events):
-                    if i != j:
-                        key = (i, j)
-                        coincidences = self._calculate_coincidences(MEi, MEj, tau_k)
-                        results[key] = np.sum(coincidences) / coincidences.size
-        return results
+        """Compute synchronization for macro-events as an (S, S) array with a NaN diagonal."""
+        return self._compute_synchronization(macro_events, ~np.eye(len(macro_events), dtype=bool))
 
-    def compute_aggregated_macro_event_synchronization(self, macro_event_results, aggregation_classes):
-        """Aggregate synchronization results for macro-events."""
-        results = {}
-        if aggregation_classes:
-            for agg_class in aggregation_classes:
-                aggregated_result = 0
-                count = 0
-                for key, value in macro_event_results.items():
-                    if key[0] in agg_class and key[1] in agg_class:
-                        aggregated_result += value
-                        count += 1
-                if count > 0:
-                    results[agg_class] = aggregated_result / count
-        return results
+    def compute_aggregated_macro_event_synchronization(self, macro_event_results, aggregation_classes, *, classes=None):
+        """Aggregate synchronization results for macro-events by the classes of their series.
+
+        Without classes nothing can be mapped to an aggregation class, so the result is empty,
+        as it always was before the classes argument existed.
+        """
+        if classes is None:
+            return {}
+        return self._aggregate(macro_event_results, classes, aggregation_classes)
@@ -1,6 +1,6 @@
 import matplotlib.pyplot as plt
+import numpy as np
 import seaborn as sns
-import pandas as pd
 
 class MECSVisualizer:
     def __init__(self, mecs_results):
@@ -16,11 +16,22 @@ class MECSVisualizer:
         plt.savefig("time_series_plot.png")
         plt.close()
 
+    @staticmethod
+    def _pairs_to_array(data):
+        # Legacy results: dict keyed by (i, j, ...) tuples, scattered into an (S, S) array
+        rows = np.fromiter((key[0] for key in data), dtype=np.intp, count=len(data))
+        cols = np.fromiter((key[1] for key in data), dtype=np.intp, count=len(data))
+        values = np.fromiter(data.values(), dtype=float, count=len(data))
+        size = max(rows.max(), cols.max()) + 1 if len(data) else 0
+        array = np.full((size, size), np.nan)
+        array[rows, cols] = values
+        return array
+
     def heatmap(self, data, title):
-        # Convert dictionary to 2D DataFrame
-        df = pd.DataFrame.from_dict(data, orient='index')
-        df = df.unstack().unstack()
-        sns.heatmap(df, cmap="YlGnBu", annot=True)
+        # data is the (S, S) score array from MECS; NaN cells (excluded pairs) are left blank
+        if isinstance(data, dict):
+            data = self._pairs_to_array(data)
+        sns.heatmap(data, cmap="YlGnBu", annot=True, mask=np.isnan(data))
         plt.title(title)
         plt.savefig(f"{title}.png")
         plt.close()
@@ -38,10 +49,22 @@ class MECSVisualizer:
         plt.close()
 
 
-    def plot_macro_events(self, time_series, macro_events):
+    @staticmethod
+    def _macro_event_mask(ts, macro_events, indices=False):
+        # Positions (identify_macro_events(..., return_indices=True)) are set directly;
+        # values get one vectorized membership test per series instead of a list scan per sample
+        if indices:
+            mask = np.zeros(len(ts), dtype=bool)
+            mask[np.asarray(macro_events, dtype=np.intp)] = True
+            return mask
+        return np.isin(ts, macro_events)
+
+    def plot_macro_events(self, time_series, macro_events, indices=False):
+        # Pass indices=True when macro_events holds positions rather than values
         for i, ts in enumerate(time_series):
             plt.plot(ts, alpha=0.5)
-            plt.scatter(range(len(ts)), ts, c=['red' if t in macro_events[i] else 'blue' for t in ts], s=5)
+            is_macro_event = self._macro_event_mask(ts, macro_events[i], indices)
+            plt.scatter(range(len(ts)), ts, c=np.where(is_macro_event, 'red', 'blue'), s=5)
         plt.title("Macro Events in Time Series")
         plt.xlabel("Time")
         plt.ylabel("Value")
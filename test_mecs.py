@@ -0,0 +1,245 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import mecs
+from mecs import MECS
+
+
+def brute_force(A, B, tau):
+    """Mean coincidence over all pairs, straight from the definition of the triangular window."""
+    d = np.abs(np.asarray(A, dtype=np.float64)[:, None] - np.asarray(B, dtype=np.float64)[None, :])
+    return np.array([np.mean((1 - d / t) * (d <= t)) for t in tau])
+
+
+def brute_force_scores(time_series, tau):
+    S = len(time_series)
+    scores = np.full((S, S), np.nan)
+    for i in range(S):
+        for j in range(S):
+            if i != j and len(time_series[i]) and len(time_series[j]):
+                scores[i, j] = brute_force(time_series[i], time_series[j], tau).mean()
+    return scores
+
+
+def make_series(kind, rng, n):
+    if kind == 'int16':
+        return rng.integers(60, 190, n).astype(np.int16)
+    if kind == 'int64':
+        # Millisecond epoch timestamps
+        return 1_700_000_000_000 + rng.integers(0, 10 ** 6, n)
+    if kind == 'float':
+        # Second epoch timestamps over a short span: shifted prefix sums stay accurate
+        return 1.7e9 + rng.uniform(0, 100.0, n)
+    # Jittered second epoch timestamps on a grid spanning months: prefix sums would cancel,
+    # so windows are summed directly
+    return 1.7e9 + 100.0 * rng.integers(0, 10 ** 5, n) + rng.normal(0, 0.01, n)
+
+
+TAU = {'int16': [5, 10, 15, 20], 'int64': [50, 500], 'float': [0.005, 0.05], 'epoch': [0.05, 0.5]}
+KINDS = list(TAU)
+
+KERNELS = [mecs._sorted_coincidences_numpy]
+if mecs.numba is not None:
+    KERNELS.append(mecs._sorted_coincidences)
+
+
+@pytest.mark.parametrize('kernel', KERNELS)
+@pytest.mark.parametrize('kind', KINDS)
+def test_sorted_kernels_match_brute_force(kernel, kind):
+    rng = np.random.default_rng(0)
+    tau = np.array(TAU[kind])
+    for n_a, n_b in [(1, 1), (3, 40), (2000, 1500)]:
+        flat, offsets = MECS._sorted_series([make_series(kind, rng, n_a), make_series(kind, rng, n_b)])
+        A, B = flat[:offsets[1]], flat[offsets[1]:]
+        got = kernel(A, B, tau, flat.dtype.kind in 'iu')
+        np.testing.assert_allclose(got, brute_force(A, B, tau), rtol=1e-9, atol=1e-15)
+
+
+@pytest.fixture(params=['numba', 'numpy', 'threads'])
+def cpu_path(request, monkeypatch):
+    """Run MECS on the Numba pair loop, the NumPy kernel, or the NumPy kernel in a thread pool."""
+    if request.param == 'numba' and mecs.numba is None:
+        pytest.skip('numba is not installed')
+    if request.param != 'numba':
+        monkeypatch.setattr(mecs, 'numba', None)
+        monkeypatch.setattr(mecs, '_sorted_coincidences', mecs._sorted_coincidences_numpy)
+    return {'n_jobs': -1} if request.param == 'threads' else {}
+
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_synchronization_matches_brute_force(cpu_path, kind):
+    rng = np.random.default_rng(1)
+    time_series = [make_series(kind, rng, n) for n in (50, 80, 0, 65)]
+    tau = TAU[kind]
+    scores = MECS(tau, **cpu_path).compute_macro_event_synchronization(time_series)
+    np.testing.assert_allclose(scores, brute_force_scores(time_series, tau), rtol=1e-9, atol=1e-15)
+
+
+def test_custom_functions_match_brute_force(cpu_path):
+    rng = np.random.default_rng(2)
+    time_series = [make_series('float', rng, n) for n in (40, 70, 55)]
+    tau = TAU['float']
+    triangle = lambda d, t: (1 - d / t) * (0 <= d) * (d <= t)
+    scores = MECS(tau, coincidence_function=triangle, **cpu_path).compute_macro_event_synchronization(time_series)
+    np.testing.assert_allclose(scores, brute_force_scores(time_series, tau), rtol=1e-9, atol=1e-15)
+
+
+def test_scores_average_over_tau(cpu_path):
+    # |0 - 1| = 1 scores 1 - 1/2 at tau=2 and 1 - 1/4 at tau=4; the pair score is their mean
+    scores = MECS([2, 4], **cpu_path).compute_macro_event_synchronization([[0], [1]])
+    assert scores[0, 1] == pytest.approx((0.5 + 0.75) / 2)
+
+
+@pytest.mark.parametrize('distance_metric', [None, lambda x, y: np.abs(x - y)])
+def test_chunked_coincidences_match_brute_force(distance_metric):
+    # 3000 x 3000 spans about 300 row-chunks of _CHUNK_BYTES; None goes through cdist when SciPy is installed
+    rng = np.random.default_rng(4)
+    TSi, TSj = rng.uniform(60, 190, 3000), rng.uniform(60, 190, 3000)
+    assert len(TSi) > mecs._CHUNK_BYTES // (8 * len(TSj))
+    tau = [5, 10]
+    triangle = lambda d, t: (1 - d / t) * (0 <= d) * (d <= t)
+    m = MECS(tau, distance_metric=distance_metric, coincidence_function=triangle)
+    np.testing.assert_allclose(m._calculate_coincidences(TSi, TSj), brute_force(TSi, TSj, tau), rtol=1e-12)
+
+
+def test_cuda_backend_matches_brute_force(monkeypatch):
+    # NumPy stands in for CuPy, exercising the batched, masked GPU code path
+    cupy = types.ModuleType('cupy')
+    for name in ('asarray', 'arange', 'zeros', 'float64'):
+        setattr(cupy, name, getattr(np, name))
+    cupy.asnumpy = np.asarray
+    monkeypatch.setitem(sys.modules, 'cupy', cupy)
+    rng = np.random.default_rng(3)
+    time_series = [make_series('int16', rng, n) for n in (30, 45, 0, 20)]
+    tau = TAU['int16']
+    scores = MECS(tau, backend='cuda').compute_macro_event_synchronization(time_series)
+    np.testing.assert_allclose(scores, brute_force_scores(time_series, tau), rtol=1e-6, equal_nan=True)
+
+
+def test_custom_metric_sees_unnarrowed_integers():
+    # (300 - 10) ** 2 overflows int16, so small integers must not be narrowed for a custom metric
+    squared = MECS([100000], distance_metric=lambda x, y: (x - y) ** 2)
+    scores = squared.compute_macro_event_synchronization([[0, 300], [10, 290]])
+    d = np.subtract.outer([0, 300], [10, 290]) ** 2
+    assert scores[0, 1] == pytest.approx(np.mean((1 - d / 100000) * (d <= 100000)))
+
+
+def test_custom_coincidence_function_sees_unnarrowed_distances():
+    # d ** 2 overflows int16 for d = 4800, which would push the score above 1
+    gaussian = lambda d, t: np.exp(-(d ** 2) / (t * 1e6))
+    scores = MECS([5], coincidence_function=gaussian).compute_macro_event_synchronization([[0, 1000], [5000, 200]])
+    d = np.abs(np.subtract.outer([0, 1000], [5000, 200])).astype(np.float64)
+    assert scores[0, 1] == pytest.approx(np.mean(gaussian(d, 5)))
+
+
+@pytest.mark.parametrize('criteria', [lambda x: 1 < x < 3, lambda x: x is not None, lambda x: x >= 2])
+@pytest.mark.parametrize('return_indices', [False, True])
+def test_identify_macro_events_accepts_scalar_criteria(criteria, return_indices):
+    time_series = [[1, 2, 3], [0, 2.5, 5]]
+    expected = MECS([1]).identify_macro_events(time_series, criteria, vectorized=False, return_indices=return_indices)
+    found = MECS([1]).identify_macro_events(time_series, criteria, return_indices=return_indices)
+    assert [list(events) for events in found] == [list(events) for events in expected]
+
+
+@pytest.mark.parametrize('n_jobs', [0, -2, 2.5, True, '4'])
+def test_invalid_n_jobs_is_rejected(n_jobs):
+    with pytest.raises(ValueError, match='n_jobs'):
+        MECS([1], n_jobs=n_jobs)
+
+
+def test_default_coincidence_function_keeps_float64_precision():
+    d = np.linspace(0, 3, 101)
+    np.testing.assert_allclose(MECS._default_coincidence_function(d, 3), 1 - d / 3, rtol=0, atol=1e-15)
+
+
+def test_aggregated_scores_average_member_pairs():
+    rng = np.random.default_rng(5)
+    time_series = [make_series('int16', rng, 40) for _ in range(6)]
+    classes = ['a', 'b', 'a', 'c', 'b', 'c']
+    aggregation_classes = [('a', 'b'), ('c',), ('d',)]
+    m = MECS(TAU['int16'])
+    inter = m.compute_inter_class_synchronization(time_series, classes)
+    aggregated = m.compute_aggregated_inter_class_synchronization(inter, aggregation_classes, classes=classes)
+    members = [i for i, label in enumerate(classes) if label in ('a', 'b')]
+    expected = np.mean([inter[i, j] for i in members for j in members if classes[i] != classes[j]])
+    # ('c',) has no cross-class pairs and ('d',) no series, so neither is reported
+    assert aggregated == {('a', 'b'): pytest.approx(expected)}
+
+
+def test_aggregate_skips_nan_and_unmatched_classes():
+    results = np.array([[np.nan, 1.0, 2.0], [3.0, np.nan, np.nan], [4.0, 6.0, np.nan]])
+    classes = ['x', 'y', 'z']
+    m = MECS([1])
+    # x and z are in the first aggregation class, y in the second; w has no series
+    assert m._aggregate(results, classes, [('x', 'z'), ('y', 'w'), ('w',)]) == {('x', 'z'): 3.0}
+    assert m._aggregate(results, classes, [('x', 'y', 'z')]) == {('x', 'y', 'z'): pytest.approx(16 / 5)}
+    assert m._aggregate(results, classes, []) == {}
+
+
+def test_aggregated_methods_take_classes_by_keyword():
+    m = MECS([1])
+    with pytest.raises(TypeError):
+        m.compute_aggregated_inter_class_synchronization(np.zeros((2, 2)), [('a',)], ['a', 'b'])
+
+
+def test_macro_event_aggregation_needs_classes():
+    rng = np.random.default_rng(6)
+    macro_events = [make_series('int16', rng, n) for n in (10, 0, 15, 12)]
+    classes = ['a', 'a', 'b', 'a']
+    m = MECS(TAU['int16'])
+    macro = m.compute_macro_event_synchronization(macro_events)
+    assert m.compute_aggregated_macro_event_synchronization(macro, [('a',)]) == {}
+    aggregated = m.compute_aggregated_macro_event_synchronization(macro, [('a',), ('b',)], classes=classes)
+    # Series 1 has no macro-events and b has a single series, so only a's two scored pairs count
+    assert aggregated == {('a',): pytest.approx(np.mean([macro[0, 3], macro[3, 0]]))}
+
+
+def test_encode_classes_round_trips_labels():
+    classes = ['tennis', 'soccer', 'tennis', 'basketball']
+    labels, codes = MECS._encode_classes(classes)
+    assert codes.dtype == np.int32
+    assert list(labels[codes]) == classes
+
+
+def test_class_masks_select_same_and_cross_class_pairs():
+    classes = ['a', 'b', 'a']
+    time_series = [[0, 1], [0, 1], [0, 1]]
+    m = MECS([1])
+    intra = ~np.isnan(m.compute_intra_class_synchronization(time_series, classes))
+    inter = ~np.isnan(m.compute_inter_class_synchronization(time_series, classes))
+    np.testing.assert_array_equal(intra, [[False, False, True], [False, False, False], [True, False, False]])
+    np.testing.assert_array_equal(inter, [[False, True, False], [True, False, True], [False, True, False]])
+
+
+def test_class_to_agg_maps_labels_to_every_containing_aggregation_class():
+    aggregation_classes = [('a', 'b'), ('b', 'c'), ('d',)]
+    assert MECS._class_to_agg(aggregation_classes) == {
+        'a': frozenset({('a', 'b')}),
+        'b': frozenset({('a', 'b'), ('b', 'c')}),
+        'c': frozenset({('b', 'c')}),
+        'd': frozenset({('d',)}),
+    }
+
+
+def test_overlapping_aggregation_classes_each_get_their_pairs():
+    time_series = [[0, 1], [0, 2], [0, 3]]
+    classes = ['a', 'b', 'c']
+    m = MECS([5])
+    inter = m.compute_inter_class_synchronization(time_series, classes)
+    aggregated = m.compute_aggregated_inter_class_synchronization(inter, [('a', 'b'), ('b', 'c')], classes=classes)
+    assert aggregated == {('a', 'b'): pytest.approx(inter[0, 1]), ('b', 'c'): pytest.approx(inter[1, 2])}
+
+
+def test_plot_macro_events_marks_positions_or_values():
+    pytest.importorskip('seaborn')
+    from mecs_visualizer import MECSVisualizer
+
+    ts = np.array([5, 1, 5, 0])
+    indices = MECS([1]).identify_macro_events([ts], lambda x: x == 0, return_indices=True)[0]
+    # Position 3 holds 0; read as a value, 3 would match nothing
+    np.testing.assert_array_equal(MECSVisualizer._macro_event_mask(ts, indices, indices=True), [0, 0, 0, 1])
+    np.testing.assert_array_equal(MECSVisualizer._macro_event_mask(ts, [5]), [1, 0, 1, 0])
+    np.testing.assert_array_equal(MECSVisualizer._macro_event_mask(ts, [], indices=True), [0, 0, 0, 0])